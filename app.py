@@ -5,9 +5,23 @@ import numpy as np
 import dash_html_components as html
 import dash_core_components as dcc
 import dash_bootstrap_components as dbc
+import dash_table
 import dash
+from dash.dependencies import Input, Output
+from dash.exceptions import PreventUpdate
+from flask import redirect, send_from_directory
 import plotly.graph_objects as go
 import plotly.io as pio
+import quality
+import spatial
+import tiles
+import orders
+import ranking
+import export
+import temporal
+import cohort
+import rendering
+from rollups import Rollups
 pio.templates.default = "plotly_white"
 
 
@@ -17,7 +31,22 @@ pio.templates.default = "plotly_white"
    ------------------------------------------------------------------------------------------- 
 '''
 load_dotenv()
-MAPBOX_TOKEN = os.environ.get('MAPBOX_TOKEN')
+# map tiles are served by the app itself once seeded (python tiles.py), so the report works offline
+TILE_DIR = os.environ.get('TILE_DIR', tiles.TILE_DIR)
+TILE_URL = os.environ.get(
+    'TILE_URL', '/tiles/{z}/{x}/{y}.png' if os.path.isdir(TILE_DIR) else tiles.TILE_SOURCE)
+ZIP_INFO = 'data/zip_info.csv'
+CLEAN_DATA = 'data/clean_data.csv'
+VALIDATED_CLEAN_DATA = 'data/validated_clean_data.csv'
+# orders of Table 1, validated ones once python quality.py has been run on the exports
+ORDER_SOURCE = os.environ.get(
+    'ORDER_SOURCE',
+    quality.VALIDATED_DATA if os.path.exists(quality.VALIDATED_DATA) else 'data/raw_data.csv')
+ORDERS_PAGE_SIZE = 10
+# highlighted products and number of cities drawn in the rankings
+PRODUCT_TOP_K = 4
+PRODUCT_BOTTOM_K = 5
+CITY_TOP_K = 20
 
 DASH_CONFIG = {'displayModeBar': False, 'showAxisDragHandles': False,
                'responsive': True, "scrollZoom": False}
@@ -54,13 +83,19 @@ def millify(n):
 
 '''
 # LOAD DATA
-raw_data = pd.read_csv('data/raw_data.csv')
-raw_data.sort_values(by="Date", inplace=True)
-data = pd.read_csv('data/clean_data.csv')
+# the orders are browsed page by page from a columnar store, rebuilt when its source changes
+orders.ensure(ORDER_SOURCE)
+order_store = orders.OrderStore()
+# malformed and duplicated order lines are dropped once, each time the clean data changes
+if quality.is_stale(VALIDATED_CLEAN_DATA, CLEAN_DATA):
+    quality.validate(CLEAN_DATA, VALIDATED_CLEAN_DATA)
+data = pd.read_csv(VALIDATED_CLEAN_DATA)
+rollups = Rollups(data)
+export.register(server, rollups)
 
 # 1. ANALYSE DES PRODUITS
 # -----------------------
-product_report = data.groupby(['Cat', 'Product', 'Price Each']).sum()
+product_report = rollups.product_report()
 
 product_list = product_report.index.get_level_values('Product')
 categories_list = product_report.index.get_level_values('Cat')
@@ -86,23 +121,21 @@ parcats = go.Figure(
 parcats.update_layout(margin=dict(l=45, r=80, t=20, b=20))
 
 # Figure 2 (horizontal bar): Classement des produits
-df = product_report.sort_values(by="Sales").reset_index(["Cat", "Price Each"])
-df["percent"] = df["Sales"]/df["Sales"].sum() * 100
+df = rollups.product_ranking(PRODUCT_TOP_K, PRODUCT_BOTTOM_K)
+shares = ranking.shares(df, "percent") * 100
 # sales labels
-df["text"] = [f"{int(np.round(p))}%" for p in df["percent"]]
-text = [None] * len(df)
-text[-4:] = df.text[-4:]
+text = [f"{int(np.round(p))}%" if group == "top" else None
+        for p, group in zip(df["percent"], df["group"])]
 # color
-colors = np.array(["rgba(142, 143, 144, 0.8)"]*len(df))
-colors[-4:] = CUSTOM_BLUE
-colors[:5] = CUSTOM_ORANGE
+colors = df["group"].map({"top": CUSTOM_BLUE, "bottom": CUSTOM_ORANGE}).fillna(
+    "rgba(142, 143, 144, 0.8)")
 # plot
 product_bar = go.Figure(
     go.Bar(
         y=df.index,
         x=df["percent"],
         marker_color=colors,
-        customdata=df["Cat"]))
+        customdata=df["Cat"].fillna("")))
 # update
 product_bar.update_layout(
     height=600, margin={**DEFAULT_MARGIN, **{"pad": 10, "t": 50}})
@@ -120,16 +153,16 @@ product_bar.add_annotation(
     showarrow=False,
     font=dict(color="#8E8F90", size=13))
 product_bar.add_annotation(
-    text="""<b>3.1% du Chiffre d'affaires</b>
-        <br><span style="color:#6c757d;">pour 5 des 19 produits</span>""",
+    text=f"""<b>{shares['bottom']:.2g}% du Chiffre d'affaires</b>
+        <br><span style="color:#6c757d;">pour {PRODUCT_BOTTOM_K} des {len(product_report)} produits</span>""",
     align="left",
     x=0.05, xref="paper",
     y=0.1, yref="paper",
     showarrow=False,
     font=dict(color=CUSTOM_ORANGE, size=15))
 product_bar.add_annotation(
-    text="""<b>58% du Chiffre d'affaires</b>
-        <br><span style="color:#6c757d;">pour les 4 meilleurs produits</span>""",
+    text=f"""<b>{shares['top']:.2g}% du Chiffre d'affaires</b>
+        <br><span style="color:#6c757d;">pour les {PRODUCT_TOP_K} meilleurs produits</span>""",
     align="left",
     x=0.6, xref="paper", xanchor="left",
     y=0.93, yref="paper",
@@ -145,7 +178,7 @@ df.loc[df["Sales"] > 2.9e6, "colors"] = CUSTOM_BLUE
 df.loc[df["Price Each"] < 75, "colors"] = CUSTOM_ORANGE
 # plot
 scatter_plot_product = go.Figure(
-    go.Scatter(
+    rendering.scatter(
         x=df["Price Each"],
         y=df["Sales"],
         mode="markers",
@@ -271,61 +304,72 @@ high_cost_viz.update_traces(
 
 # 2. ANALYSE DES LIEUX DE VENTES
 # -------------------------------
-city_sales = data.groupby(['City', 'lat', 'long']).sum()['Sales'].reset_index()
-city_sales['Sales_text'] = city_sales['Sales'].apply(lambda x: millify(x))
-cities = city_sales['City']
-city_sales['percents'] = city_sales['Sales']/city_sales['Sales'].sum()
 
 # Figure 5 (map): Cartographie des lieux de ventes
-# plot
-map_plot = go.Figure(
-    go.Scattermapbox(
-        lat=city_sales['lat'],
-        lon=city_sales['long'],
-        marker=dict(
-            size=city_sales['Sales']/350000,
-            opacity=0.5,
-            allowoverlap=True,
-            color=CUSTOM_BLUE),
-        hoverinfo='none'
+zip_info = pd.read_csv(ZIP_INFO, dtype={'zip': str}) if os.path.exists(ZIP_INFO) else None
+sales_pyramid = spatial.SalesPyramid(spatial.order_points(data, zip_info))
+MAP_CENTER = dict(lat=40, lon=-97)
+MAP_ZOOM = 2.9
+
+
+def build_map(cells, center=MAP_CENTER, zoom=MAP_ZOOM):
+    # only the biggest cells are labelled
+    labels = cells['label'].where(cells['Sales'].rank(ascending=False) <= 20, '')
+    size = cells['Sales'] / cells['Sales'].max() * 40
+    map_plot = go.Figure(
+        go.Scattermapbox(
+            lat=cells['lat'],
+            lon=cells['long'],
+            marker=dict(
+                size=size * 0.57,
+                opacity=0.5,
+                allowoverlap=True,
+                color=CUSTOM_BLUE),
+            hoverinfo='none'
+        )
     )
-)
-# add border
-map_plot.add_trace(
-    go.Scattermapbox(
-        lat=city_sales['lat'],
-        lon=city_sales['long'],
-        marker=dict(
-            size=city_sales['Sales']/200000,
-            opacity=0.3,
-            allowoverlap=True,
-            color=CUSTOM_BLUE),
-        mode="markers+text",
-        textposition="top center",
-        textfont=dict(family="sans serif", size=16, color="black"),
-        text=cities
+    # add border
+    map_plot.add_trace(
+        go.Scattermapbox(
+            lat=cells['lat'],
+            lon=cells['long'],
+            marker=dict(
+                size=size.clip(lower=3),
+                opacity=0.3,
+                allowoverlap=True,
+                color=CUSTOM_BLUE),
+            mode="markers+text",
+            textposition="top center",
+            textfont=dict(family="sans serif", size=16, color="black"),
+            text=labels,
+            customdata=cells['Sales'].apply(millify),
+            hovertemplate="<b>%{text}</b><br>%{customdata} $<extra></extra>"
+        )
     )
-)
-# update
-map_plot.update_layout(
-    hoverlabel=dict(
-        bgcolor="white",
-        font_size=12),
-    margin=dict(l=0, r=0, t=0, b=0),
-    mapbox=dict(
-        accesstoken=MAPBOX_TOKEN,
-        zoom=2.9,
-        center=go.layout.mapbox.Center(lat=40, lon=-97),
-        style="mapbox://styles/axelitorosalito/ckb2erv2q148d1jnp7959xpz0"),
-    showlegend=False
-)
+    # update
+    map_plot.update_layout(
+        hoverlabel=dict(
+            bgcolor="white",
+            font_size=12),
+        margin=dict(l=0, r=0, t=0, b=0),
+        mapbox=dict(
+            zoom=zoom,
+            center=center,
+            style="white-bg",
+            layers=[dict(below="traces", sourcetype="raster", source=[TILE_URL])]),
+        uirevision="map",
+        showlegend=False
+    )
+    return map_plot
+
+
+map_plot = build_map(sales_pyramid.query(MAP_ZOOM))
 
 # Figure 6 (horizontal bar): Classement des villes
-df = city_sales.copy()
-df.sort_values(by="Sales", inplace=True)
+df = rollups.city_ranking(CITY_TOP_K)
 city_rank = go.Figure(
     go.Bar(
-        y=df['City'],
+        y=df.index,
         x=df['percents'],
         hovertemplate="<b>%{y}</b><br>%{x:.2%} du chiffre d'affaires<extra></extra>")
 )
@@ -351,7 +395,7 @@ city_rank.add_annotation(
 df = pd.read_csv("data/city_info.csv")
 # plot
 sales_income = go.Figure(
-    go.Scatter(
+    rendering.scatter(
         x=df["income_2010"],
         y=df["Sales"],
         mode="markers+text",
@@ -381,7 +425,7 @@ city_color = (df['City'] == "San Francisco").map(
     lambda x: CUSTOM_BLUE if x else "grey")
 # plot
 sales_ads = go.Figure(
-    go.Scatter(
+    rendering.scatter(
         x=df["ads_budget"],
         y=df["Sales"],
         mode="markers",
@@ -423,13 +467,12 @@ sales_ads.update_layout(
 
 # 3. ANALYSE TEMPORELLE
 # -----------------------
-sales_per_month = data.groupby(['Month_num', 'Month'])[
-    'Sales'].sum().reset_index()
+sales_per_month = rollups.sales_per_month()
 
 # Figure 9 (line): chiffre d'affaires mensuel
 # plot
 ca_per_month = go.Figure(
-    go.Scatter(
+    rendering.scatter(
         x=sales_per_month["Month"],
         y=sales_per_month["Sales"],
         fill="tozeroy",
@@ -470,10 +513,10 @@ ca_per_month.update_layout(
 
 
 # Figure 10 (line): heures d'achats des produits
-buying_hours = data.groupby('Hour').sum()['Quantity Ordered']
+buying_hours = rollups.buying_hours()
 # plot
 sales_per_hour = go.Figure(
-    go.Scatter(
+    rendering.scatter(
         x=buying_hours.index,
         y=buying_hours,
         fill="tozeroy",
@@ -508,6 +551,69 @@ sales_per_hour.update_layout(
     ]
 )
 
+
+# Figure 11 (heatmap): heures d'achats par jour de la semaine et par ville
+def build_heatmap(city=None):
+    df = rollups.hour_of_week()
+    if city:
+        df = df[df['City'] == city]
+    heatmap = go.Figure(
+        go.Heatmap(
+            z=temporal.week_matrix(df, 'Sales'),
+            x=list(range(24)),
+            y=temporal.WEEKDAYS,
+            customdata=temporal.week_matrix(df, 'orders'),
+            colorscale=[[0, "white"], [1, CUSTOM_BLUE]],
+            showscale=False,
+            xgap=1, ygap=1,
+            hovertemplate="<b>%{y} %{x}h</b><br>%{z:.3s} $ de CA<br>%{customdata:.0f} commandes<extra></extra>"
+        )
+    )
+    # update
+    heatmap.update_xaxes(tickfont_color="grey", ticksuffix="h", showgrid=False,
+                         zeroline=False, fixedrange=True)
+    heatmap.update_yaxes(tickfont_color="grey", autorange="reversed", showgrid=False,
+                         fixedrange=True)
+    heatmap.update_layout(
+        height=400,
+        margin=DEFAULT_MARGIN,
+        hoverlabel=dict(bgcolor="white", font_size=14))
+    return heatmap
+
+
+# 4. FIDÉLISATION DE LA CLIENTÈLE
+# -------------------------------
+cohorts = cohort.build(cohort.frame_partitions(data))
+
+# Figure 12 (heatmap): rétention des clients par cohorte
+retention = cohorts.retention()
+retention_plot = go.Figure(
+    go.Heatmap(
+        z=retention.to_numpy(),
+        x=retention.columns,
+        y=retention.index,
+        customdata=cohorts.matrix('Sales').to_numpy(),
+        colorscale=[[0, "white"], [1, CUSTOM_BLUE]],
+        # the first month is always 100%, the scale is set on the following ones
+        zmax=retention.iloc[:, 1:].max().max() if retention.shape[1] > 1 else 1,
+        showscale=False,
+        xgap=1, ygap=1,
+        hovertemplate="<b>Cohorte %{y}</b>, %{x} mois après le premier achat<br>%{z:.1%} des clients<br>%{customdata:.3s} $ de CA<extra></extra>"
+    )
+)
+# update
+retention_plot.update_xaxes(title=dict(text="Mois après le premier achat", font_color="grey"),
+                            tickfont_color="grey", showgrid=False, zeroline=False, fixedrange=True)
+retention_plot.update_yaxes(tickfont_color="grey", autorange="reversed", type="category",
+                            showgrid=False, fixedrange=True)
+retention_plot.update_layout(
+    height=500,
+    margin=DEFAULT_MARGIN,
+    hoverlabel=dict(bgcolor="white", font_size=14))
+
+heatmap_cities = [{"label": "Toutes les villes", "value": "all"}] + [
+    {"label": city, "value": city} for city in rollups.city_sales()['City']]
+
 '''------------------------------------------------------------------------------------------- 
                                             DASH LAYOUT
    ------------------------------------------------------------------------------------------- 
@@ -538,9 +644,27 @@ app.layout = dbc.Container([
             ## Introduction et présentation des données
             Les données utilisées représentent les ventes de produits électroniques réalisées par un commerce en ligne 
             fictif durant l’année 2019. (Voir le tableau 1)'''),
-        dbc.Table.from_dataframe(raw_data[:4], striped=True, bordered=False,
-                                 borderless=True, hover=True, responsive=True, className="mt-3"),
-        dcc.Markdown("**Tableau 1**: présentation du jeu de données",
+        html.Div(
+            dash_table.DataTable(
+                id="orders-table",
+                columns=[{"name": column, "id": column} for column in orders.RAW_COLUMNS],
+                data=order_store.page(0, ORDERS_PAGE_SIZE)[0].to_dict("records"),
+                page_current=0,
+                page_size=ORDERS_PAGE_SIZE,
+                page_action="custom",
+                sort_action="custom",
+                sort_mode="single",
+                sort_by=[],
+                filter_action="custom",
+                filter_query="",
+                style_as_list_view=True,
+                style_header={"fontWeight": "bold", "backgroundColor": "white"},
+                style_cell={"textAlign": "left", "padding": "0.5rem",
+                            "font-family": "Verdana, Geneva, sans-serif"},
+                style_data_conditional=[
+                    {"if": {"row_index": "odd"}, "backgroundColor": "rgba(0, 0, 0, 0.05)"}]),
+            className="mt-3"),
+        dcc.Markdown("**Tableau 1**: présentation du jeu de données, chaque colonne peut être triée et filtrée",
                      className="text-muted mb-3"),
         dcc.Markdown('''
             Pour chaque commande un ensemble d'informations est collecté sur le client. Par exemple, la première ligne du tableau 
@@ -561,12 +685,13 @@ app.layout = dbc.Container([
         dcc.Markdown('''
             Dans les sections suivantes, nous allons transformer cette masse de données en un ensemble d’informations pertinentes. 
             Elles seront ensuite couplées à des éléments provenant de l'écosystème de l'entreprise afin d’élaborer des choix stratégiques 
-            réfléchis. La suite du présent rapport se divise en trois parties :  
+            réfléchis. La suite du présent rapport se divise en quatre parties :  
             
             1. **Positionnement de l'entreprise**, nous analyserons les ventes de produits afin d'améliorer le positionnement de l'entreprise  
             2. **Ciblage marketing**, nous analyserons les lieux de ventes afin d'améliorer la stratégie marketing de l'entreprise  
             3. **Saisonnalité et horaires**, nous analyserons les tendances d'achat des clients afin d'y déterminer les périodes creuses et les 
-            périodes de forte affluence'''),
+            périodes de forte affluence  
+            4. **Fidélisation de la clientèle**, nous analyserons le retour des clients après leur premier achat'''),
 
         # 1. POSITIONNEMENT DE L'ENTREPRISE
         dcc.Markdown('''
@@ -714,8 +839,8 @@ app.layout = dbc.Container([
             Le service de livraison de ce commerce en ligne est disponible dans 9 villes américaines, dont New York, Los Angeles ou encore San Francisco... 
             A l'aide des figures ci-dessous, on observe que San Francisco est la ville qui a réalisé le plus important volume de ventes en 2019.'''),
         # Figure 5 (map): carte des lieux de ventes
-        dcc.Graph(figure=map_plot, config={
-                  **DASH_CONFIG, **{'staticPlot': True}}),
+        dcc.Graph(id="sales-map", figure=map_plot, config={
+                  **DASH_CONFIG, **{'scrollZoom': True}}),
         dcc.Markdown("**Figure 5**: cartographie des lieux de vente",
                      className="text-muted mb-5"),
         # Figure 6 (horizontal bar): classement des lieux de ventes
@@ -817,6 +942,18 @@ app.layout = dbc.Container([
         dcc.Graph(figure=sales_per_hour, config=DASH_CONFIG),
         dcc.Markdown("**Figure 10**: nombre de ventes par heures",
                      className="text-muted"),
+        dcc.Markdown('''
+            Ces horaires varient cependant d'une ville à l'autre et selon le jour de la semaine. La figure 11 détaille le chiffre d'affaires 
+            réalisé pour chaque heure de la semaine, ville par ville, afin de programmer l'affichage de la publicité au cas par cas.''',
+                     className="my-5"),
+        # Figure 11 (heatmap): Ventes par heure de la semaine et par ville
+        title("Heures d'achat au cours de la semaine",
+              "chiffre d'affaires par jour et par heure, pour chaque ville"),
+        dcc.Dropdown(id="heatmap-city", options=heatmap_cities, value="all",
+                     clearable=False, className="my-3", style={"max-width": "300px"}),
+        dcc.Graph(id="heatmap", figure=build_heatmap(), config=DASH_CONFIG),
+        dcc.Markdown("**Figure 11**: chiffre d'affaires par heure de la semaine et par ville",
+                     className="text-muted"),
         dbc.Alert(
             dcc.Markdown('''
                 ### Recommandation stratégique
@@ -825,8 +962,69 @@ app.layout = dbc.Container([
                 - **Favoriser l’affichage de la publicité pour midi et 19h**, un affichage personnalisé peut être réalisé pour chaque ville et 
                 nécessite une investigation au cas par cas.'''),
             color='secondary', className="my-5"),
+        # 4. FIDÉLISATION DE LA CLIENTÈLE
+        dcc.Markdown('''
+            ## 4. FIDÉLISATION DE LA CLIENTÈLE
+            ---
+            **Le passage vers des produits haut de gamme suppose une clientèle fidèle**, capable de revenir acheter les nouveaux produits du catalogue. 
+            Les données ne comportent pas d'identifiant client, nous utilisons donc l'adresse de livraison pour reconnaître un même client d'une commande 
+            à l'autre. Chaque client est rattaché à la cohorte du mois de son premier achat, puis nous suivons la part de chaque cohorte qui 
+            achète à nouveau les mois suivants. (Voir la figure 12)''',
+                     className="mb-5"),
+        # Figure 12 (heatmap): rétention par cohorte
+        title("Rétention des clients par cohorte",
+              "part des clients de chaque cohorte qui achètent à nouveau, mois après mois"),
+        dcc.Graph(figure=retention_plot, config=DASH_CONFIG),
+        dcc.Markdown("**Figure 12**: rétention des clients selon le mois de leur premier achat",
+                     className="text-muted mb-5"),
     ])
 ], fluid=True, className='container', style={"background-color": "white"})
 
+'''------------------------------------------------------------------------------------------- 
+                                            CALLBACKS
+   ------------------------------------------------------------------------------------------- 
+'''
+
+
+@app.callback(Output("sales-map", "figure"), Input("sales-map", "relayoutData"))
+def update_map(relayout):
+    if not relayout or "mapbox.zoom" not in relayout:
+        raise PreventUpdate
+    zoom = relayout["mapbox.zoom"]
+    cells = sales_pyramid.query(zoom, spatial.viewport(relayout))
+    return build_map(cells, relayout.get("mapbox.center", MAP_CENTER), zoom)
+
+
+@app.callback(Output("heatmap", "figure"), Input("heatmap-city", "value"))
+def update_heatmap(city):
+    return build_heatmap(None if city == "all" else city)
+
+
+@app.callback(
+    Output("orders-table", "data"),
+    Output("orders-table", "page_count"),
+    Input("orders-table", "page_current"),
+    Input("orders-table", "page_size"),
+    Input("orders-table", "sort_by"),
+    Input("orders-table", "filter_query"))
+def update_orders(page_current, page_size, sort_by, filter_query):
+    sort = (sort_by[0]["column_id"], sort_by[0]["direction"] == "asc") if sort_by else None
+    try:
+        page, total = order_store.page(
+            page_current, page_size, sort, orders.parse_filter(filter_query))
+    except ValueError:
+        # filter value or operator that does not match the type of its column
+        raise PreventUpdate
+    return page.to_dict("records"), max(1, -(-total // page_size))
+
+
+@server.route('/tiles/<int:z>/<int:x>/<int:y>.png')
+def tile(z, x, y):
+    # tiles that were not seeded (far from the orders, or past tiles.MAX_ZOOM) come from the source
+    if not os.path.exists(os.path.join(TILE_DIR, str(z), str(x), f'{y}.png')):
+        return redirect(tiles.TILE_SOURCE.format(z=z, x=x, y=y))
+    return send_from_directory(TILE_DIR, f'{z}/{x}/{y}.png')
+
+
 if __name__ == '__main__':
     app.run_server(debug=False)
@@ -0,0 +1,63 @@
+import time
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+import rendering
+
+
+'''
+   -------------------------------------------------------------------------------------------
+   CONFIG
+   -------------------------------------------------------------------------------------------
+'''
+# figures built once when app.py is imported, only their serialization is timed
+FIGURES = ['parcats', 'product_bar', 'scatter_plot_product', 'low_cost_viz', 'high_cost_viz',
+           'city_rank', 'sales_income', 'sales_ads', 'ca_per_month', 'sales_per_hour',
+           'retention_plot']
+# figures rebuilt by the callbacks, built and serialized
+BUILDERS = {
+    'map_plot': lambda app: app.build_map(app.sales_pyramid.query(app.MAP_ZOOM)),
+    'heatmap': lambda app: app.build_heatmap(),
+}
+# number of points of the synthetic catalogues, to see how the builders scale
+SIZES = [100, 10_000, 100_000]
+REPEAT = 5
+
+
+def measure(build):
+    '''Best build and serialization times (ms) over REPEAT runs, and the payload size (kB).'''
+    builds, dumps = [], []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fig = build()
+        built = time.perf_counter()
+        payload = pio.to_json(fig, validate=False)
+        builds.append(built - start)
+        dumps.append(time.perf_counter() - built)
+    return min(builds) * 1e3, min(dumps) * 1e3, len(payload) / 1e3
+
+
+def report(name, build, prebuilt=False):
+    build_ms, json_ms, kb = measure(build)
+    build_ms = '-' if prebuilt else f'{build_ms:.1f}'
+    print(f'{name:<35}{kb:>12.1f}{build_ms:>12}{json_ms:>12.1f}')
+
+
+if __name__ == '__main__':
+    import app
+
+    print(f"{'figure':<35}{'payload kB':>12}{'build ms':>12}{'json ms':>12}")
+    for name in FIGURES:
+        fig = getattr(app, name)
+        report(name, lambda: fig, prebuilt=True)
+    for name, build in BUILDERS.items():
+        report(name, lambda: build(app))
+
+    rng = np.random.default_rng(42)
+    for size in SIZES:
+        x = rng.uniform(0, 1800, size).round(2)
+        y = rng.uniform(0, 8.5e6, size)
+        report(f'synthetic {size} points',
+               lambda: go.Figure(go.Scatter(x=x, y=y, mode='markers')))
+        report(f'synthetic {size} points (auto)',
+               lambda: go.Figure(rendering.scatter(x=x, y=y, mode='markers')))
@@ -0,0 +1,148 @@
+import argparse
+import numpy as np
+import pandas as pd
+import quality
+from quality import DATE_FORMAT, CHUNKSIZE
+
+
+'''
+   -------------------------------------------------------------------------------------------
+   CONFIG
+   -------------------------------------------------------------------------------------------
+'''
+COHORT_COLUMNS = ['Purchase Address', 'Order Date', 'Sales']
+
+
+def customer_ids(addresses):
+    '''There is no customer ID in the data, the delivery address is hashed instead.'''
+    return pd.util.hash_pandas_object(addresses.str.strip().str.lower(), index=False).to_numpy()
+
+
+def month_index(dates):
+    dates = pd.to_datetime(dates, format=DATE_FORMAT)
+    return (dates.dt.year * 12 + dates.dt.month - 1).to_numpy(dtype=np.int32)
+
+
+def month_label(index):
+    return f'{index // 12}-{index % 12 + 1:02d}'
+
+
+'''
+   -------------------------------------------------------------------------------------------
+                                            ENGINE
+   -------------------------------------------------------------------------------------------
+'''
+
+
+class CohortEngine:
+    '''Cohorts of customers by month of first purchase, built one partition of orders at a time.
+
+    Partitions can come in any order and overlap in time, like an export spilling
+    into the next month: every partition is reduced to the sales of each active
+    (customer, month), merged with the previous ones, and customers are only
+    assigned to their cohort when the matrices are read. Memory is bounded by the
+    active customer-months, whatever the number of order lines.
+    '''
+
+    def __init__(self):
+        self.activity = None
+        self.totals = None
+
+    def add_partition(self, chunks):
+        '''Add a partition, given as chunks of orders with COHORT_COLUMNS.'''
+        activity = []
+        for chunk in chunks:
+            activity.append(pd.DataFrame({
+                'customer': customer_ids(chunk['Purchase Address']),
+                'month': month_index(chunk['Order Date']),
+                'Sales': chunk['Sales'].to_numpy(),
+            }).groupby(['customer', 'month'], sort=False)['Sales'].sum())
+        if not activity:
+            return
+        if self.activity is not None:
+            activity.append(self.activity)
+        # a (customer, month) found in several partitions is counted once
+        self.activity = pd.concat(activity).groupby(level=[0, 1]).sum()
+        self.totals = None
+
+    def cohort_totals(self):
+        '''Active customers and sales per (cohort, months since first purchase).'''
+        if self.totals is None:
+            activity = self.activity.reset_index()
+            first = activity.groupby('customer')['month'].transform('min')
+            activity['cohort'] = first
+            activity['offset'] = activity['month'] - first
+            # each row is one active customer in one month
+            self.totals = activity.groupby(['cohort', 'offset']).agg(
+                customers=('customer', 'size'), Sales=('Sales', 'sum'))
+        return self.totals
+
+    def matrix(self, column):
+        '''Cohort x months since first purchase matrix of `column`.
+
+        Cells after the last month of data are left empty (NaN).
+        '''
+        totals = self.cohort_totals()
+        matrix = totals[column].unstack().sort_index()
+        cohorts = matrix.index.to_numpy()[:, None]
+        offsets = matrix.columns.to_numpy()[None, :]
+        last = (totals.index.get_level_values(0) + totals.index.get_level_values(1)).max()
+        matrix = matrix.mask(matrix.isna() & (cohorts + offsets <= last), 0)
+        matrix.index = [month_label(int(index)) for index in matrix.index]
+        matrix.columns = matrix.columns.astype(int)
+        return matrix
+
+    def retention(self):
+        '''Share of every cohort still buying n months after its first purchase.'''
+        customers = self.matrix('customers')
+        return customers.div(customers[0], axis=0)
+
+
+'''
+   -------------------------------------------------------------------------------------------
+                                            PARTITIONS
+   -------------------------------------------------------------------------------------------
+'''
+
+
+def frame_partitions(data):
+    '''Month partitions of the clean data already loaded in memory.'''
+    months = month_index(data['Order Date'])
+    for month in np.unique(months):
+        yield [data.loc[months == month, COHORT_COLUMNS]]
+
+
+def read_partition(path, seen, chunksize=CHUNKSIZE):
+    '''Chunks of a raw order export, renamed to COHORT_COLUMNS.
+
+    The rows go through the checks of quality.py first: repeated headers, blank
+    and malformed lines are dropped, and so are the orders already found in this
+    file or in a previous partition sharing the same `seen` key set.
+    '''
+    for chunk in quality.read_chunks(path, chunksize):
+        chunk = chunk[~quality.check_chunk(chunk, seen).any(axis=1)]
+        yield pd.DataFrame({
+            'Purchase Address': chunk['Adresse'],
+            'Order Date': chunk['Date'],
+            'Sales': pd.to_numeric(chunk['Quantité']) * pd.to_numeric(chunk['Prix']),
+        })
+
+
+def build(partitions):
+    engine = CohortEngine()
+    for chunks in partitions:
+        engine.add_partition(chunks)
+    return engine
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Cohort retention of raw order exports, in any order.')
+    parser.add_argument('paths', nargs='+', help='raw order exports')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE)
+    args = parser.parse_args()
+
+    seen = quality.KeyStore()
+    engine = build(read_partition(path, seen, args.chunksize) for path in args.paths)
+    print(engine.retention().round(3).to_string())
+    print(engine.matrix('Sales').round(0).to_string())
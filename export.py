@@ -0,0 +1,77 @@
+import io
+from flask import Response, abort, request
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+'''
+   -------------------------------------------------------------------------------------------
+   CONFIG
+   -------------------------------------------------------------------------------------------
+'''
+AGGREGATES = ['product_report', 'city_sales', 'sales_per_month', 'buying_hours', 'hour_of_week']
+MIMETYPES = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'csv': 'text/csv',
+    'json': 'application/json',
+}
+
+
+'''
+   -------------------------------------------------------------------------------------------
+                                        SERIALIZATION
+   -------------------------------------------------------------------------------------------
+'''
+
+
+def to_arrow(df):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def serialize(df, fmt):
+    if fmt == 'arrow':
+        return to_arrow(df)
+    if fmt == 'json':
+        return df.to_json(orient='records', force_ascii=False)
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False)
+    return buffer.getvalue()
+
+
+'''
+   -------------------------------------------------------------------------------------------
+                                            ROUTES
+   -------------------------------------------------------------------------------------------
+'''
+
+
+def register(server, rollups):
+    '''Serve the aggregates of `rollups` on `/api/<aggregate>` of the flask `server`.
+
+    Query parameters: `city` and `cat` to filter the orders (404 when absent from
+    the data), `format` among arrow (default), csv and json. Without pyarrow, the
+    default is csv and an explicit arrow request is answered 406.
+    '''
+    @server.route('/api/<aggregate>')
+    def export(aggregate):
+        if aggregate not in AGGREGATES:
+            abort(404)
+        fmt = request.args.get('format')
+        if fmt is not None and fmt not in MIMETYPES:
+            abort(400)
+        if fmt == 'arrow' and pa is None:
+            abort(406)
+        fmt = fmt or ('arrow' if pa is not None else 'csv')
+        city, cat = request.args.get('city'), request.args.get('cat')
+        if not rollups.known(city, cat):
+            abort(404)
+        df = getattr(rollups, aggregate)(city, cat)
+        df = df.reset_index() if df.index.name or df.index.nlevels > 1 else df
+        return Response(serialize(df, fmt), mimetype=MIMETYPES[fmt])
@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import fcntl
+import shutil
+import argparse
+import tempfile
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from quality import RAW_COLUMNS, DATE_FORMAT, publish
+
+
+'''
+   -------------------------------------------------------------------------------------------
+   CONFIG
+   -------------------------------------------------------------------------------------------
+'''
+ORDER_STORE = 'data/orders'
+NUMERIC_COLUMNS = {'ID': np.int64, 'Quantité': np.int64, 'Prix': np.float64}
+DISPLAY_DATE_FORMAT = '%Y-%m-%d %H:%M'
+
+MARKER = 'source.json'
+
+SYMBOLS = {'>=': 'ge', '<=': 'le', '<': 'lt', '>': 'gt', '!=': 'ne', '=': 'eq'}
+# the operator is only searched right after the {column} token, never in the value
+FILTER_PART = re.compile(
+    r'^\s*\{(?P<column>[^}]+)\}\s*'
+    r'(?P<operator>>=|<=|!=|<|>|=|(?:ge|le|lt|gt|ne|eq|contains|datestartswith)(?=\s))'
+    r'\s*(?P<value>.*?)\s*$')
+
+
+'''
+   -------------------------------------------------------------------------------------------
+                                        COLUMNAR LAYOUT
+   -------------------------------------------------------------------------------------------
+'''
+
+
+def build(path, store=ORDER_STORE):
+    '''Write the orders of a csv as one memory-mappable .npy file per column.
+
+    Rows keep the order of the file. For every column a sort index
+    (`<column>.order.npy`, the row positions in ascending order) is written
+    alongside, so a sorted page never requires sorting the whole store.
+    The store is written in a new directory, then `store` (a symlink) is
+    switched to it in one step: a reader never sees a partial store.
+    '''
+    parent = os.path.dirname(store) or '.'
+    prefix = os.path.basename(store) + '-'
+    version = tempfile.mkdtemp(dir=parent, prefix=prefix)
+    df = pd.read_csv(path, dtype=str)
+    df['Date'] = pd.to_datetime(df['Date'], format=DATE_FORMAT, errors='coerce')
+    for column in NUMERIC_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+    df = df.dropna(subset=RAW_COLUMNS)
+
+    for column in RAW_COLUMNS:
+        if column == 'Date':
+            values = df[column].to_numpy(dtype='datetime64[m]')
+        elif column in NUMERIC_COLUMNS:
+            values = df[column].to_numpy(dtype=NUMERIC_COLUMNS[column])
+        else:
+            values = df[column].to_numpy(dtype=str)
+        np.save(os.path.join(version, f'{column}.npy'), values)
+        np.save(os.path.join(version, f'{column}.order.npy'),
+                np.argsort(values, kind='stable'))
+    with open(os.path.join(version, MARKER), 'w') as f:
+        json.dump({'source': path, 'mtime': os.path.getmtime(path)}, f)
+    publish(version, 0o777)
+
+    link = version + '.link'
+    os.symlink(os.path.basename(version), link)
+    if os.path.isdir(store) and not os.path.islink(store):
+        shutil.rmtree(store)
+    os.replace(link, store)
+    # previous versions, the open memory maps stay valid after the removal
+    for name in os.listdir(parent):
+        if name.startswith(prefix) and name != os.path.basename(version):
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+
+def is_stale(path, store=ORDER_STORE):
+    '''True when `store` is missing or was built from another version of `path`.'''
+    try:
+        with open(os.path.join(store, MARKER)) as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return True
+    return marker['source'] != path or marker['mtime'] != os.path.getmtime(path)
+
+
+def ensure(path, store=ORDER_STORE):
+    '''Build `store` from `path` if it is stale, one process at a time.'''
+    with open(store + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if is_stale(path, store):
+            build(path, store)
+
+
+class OrderStore:
+    '''Paginated, sortable and filterable access to the orders of a built store.'''
+
+    def __init__(self, store=ORDER_STORE):
+        self.columns = {column: np.load(os.path.join(store, f'{column}.npy'), mmap_mode='r')
+                        for column in RAW_COLUMNS}
+        self.orders = {column: np.load(os.path.join(store, f'{column}.order.npy'), mmap_mode='r')
+                       for column in RAW_COLUMNS}
+        self.size = len(self.columns['ID'])
+
+    def rows(self, positions):
+        df = pd.DataFrame({column: values[positions]
+                           for column, values in self.columns.items()})
+        df['Date'] = df['Date'].dt.strftime(DISPLAY_DATE_FORMAT)
+        return df
+
+    def page(self, page_current, page_size, sort=None, filters=()):
+        '''One page of orders and the total number of matching orders.
+
+        `sort` is a (column, ascending) pair, `filters` a tuple of
+        (column, operator, value) as returned by `parse_filter`.
+        '''
+        start = page_current * page_size
+        if filters:
+            positions = self.matching(filters, sort)
+            total = len(positions)
+            positions = positions[start:start + page_size]
+        elif sort is None:
+            total = self.size
+            positions = np.arange(start, min(start + page_size, total))
+        else:
+            column, ascending = sort
+            order = self.orders[column] if ascending else self.orders[column][::-1]
+            total = self.size
+            positions = np.asarray(order[start:start + page_size])
+        return self.rows(positions), total
+
+    @lru_cache(maxsize=32)
+    def matching(self, filters, sort=None):
+        '''Positions of the orders matching every filter, in `sort` order.'''
+        mask = np.ones(self.size, dtype=bool)
+        for column, operator, value in filters:
+            mask &= self.compare(column, operator, value)
+        positions = np.flatnonzero(mask)
+        if sort is not None:
+            column, ascending = sort
+            positions = positions[np.argsort(self.columns[column][positions], kind='stable')]
+            if not ascending:
+                positions = positions[::-1]
+        return positions
+
+    def compare(self, column, operator, value):
+        '''Mask of the orders matching a filter, ValueError if it does not apply to `column`.'''
+        values = self.columns[column]
+        if column == 'Date' and operator in ('contains', 'datestartswith'):
+            # dates are matched as displayed in the table, the text of DISPLAY_DATE_FORMAT
+            dates = np.char.replace(np.datetime_as_string(values, unit='m'), 'T', ' ')
+            if operator == 'contains':
+                return np.char.find(dates, str(value)) >= 0
+            return np.char.startswith(dates, str(value))
+        if operator == 'datestartswith':
+            raise ValueError(f'datestartswith does not apply to {column}')
+        if operator == 'contains':
+            return np.char.find(np.char.lower(np.asarray(values, dtype=str)),
+                                str(value).lower()) >= 0
+        if column == 'Date':
+            value = np.datetime64(pd.Timestamp(value), 'm')
+        elif column in NUMERIC_COLUMNS:
+            value = float(value)
+        else:
+            value = str(value)
+        return {'ge': values >= value, 'le': values <= value, 'lt': values < value,
+                'gt': values > value, 'ne': values != value, 'eq': values == value}[operator]
+
+
+'''
+   -------------------------------------------------------------------------------------------
+                                        DASH TABLE FILTERS
+   -------------------------------------------------------------------------------------------
+'''
+
+
+def split_filter_part(filter_part):
+    match = FILTER_PART.match(filter_part)
+    if match is None:
+        return [None] * 3
+    operator = SYMBOLS.get(match['operator'], match['operator'])
+    value = match['value']
+    if len(value) > 1 and value[0] == value[-1] and value[0] in ("'", '"', '`'):
+        value = value[1: -1].replace('\\' + value[0], value[0])
+    return match['column'], operator, value
+
+
+def parse_filter(filter_query):
+    '''Turn the `filter_query` of a DataTable into a hashable tuple of filters.'''
+    filters = []
+    for filter_part in (filter_query or '').split(' && '):
+        column, operator, value = split_filter_part(filter_part)
+        if column in RAW_COLUMNS and value != '':
+            filters.append((column, operator, value))
+    return tuple(filters)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the columnar order store.')
+    parser.add_argument('path', help='validated orders csv')
+    parser.add_argument('--store', default=ORDER_STORE)
+    args = parser.parse_args()
+    ensure(args.path, args.store)
@@ -0,0 +1,241 @@
+import os
+import json
+import uuid
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+
+'''
+   -------------------------------------------------------------------------------------------
+   CONFIG
+   -------------------------------------------------------------------------------------------
+'''
+RAW_COLUMNS = ['ID', 'Produit', 'Quantité', 'Prix', 'Date', 'Adresse']
+DATE_FORMAT = '%m/%d/%y %H:%M'
+CHUNKSIZE = 100_000
+
+# columns checked in the raw exports and in the clean data loaded by the report
+RAW_SCHEMA = dict(keys=['ID', 'Produit', 'Date'], quantity='Quantité', price='Prix', date='Date')
+CLEAN_SCHEMA = dict(keys=['Order ID', 'Product', 'Order Date'], quantity='Quantity Ordered',
+                    price='Price Each', date='Order Date')
+
+SEEN_KEYS = 'data/seen_keys'
+VALIDATED_DATA = 'data/validated_data.csv'
+QUALITY_REPORT = 'data/quality_report.csv'
+
+CHECKS = ['blank', 'header', 'bad_quantity', 'bad_price', 'bad_date', 'duplicate']
+
+
+def is_stale(output, source):
+    '''True when `output` is missing or older than the `source` it is built from.'''
+    return not os.path.exists(output) or os.path.getmtime(output) < os.path.getmtime(source)
+
+
+def publish(path, mode=0o666):
+    '''Give a temporary file (0600) or directory (0700) the default permissions of a new one.'''
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(path, mode & ~umask)
+
+
+'''
+   -------------------------------------------------------------------------------------------
+                                        PERSISTENT KEY SET
+   -------------------------------------------------------------------------------------------
+'''
+
+
+class KeyStore:
+    '''Set of uint64 row hashes, persisted as sorted, memory-mapped .npy segments.
+
+    The keys added during a run are kept as sorted runs, merged two by two when
+    they reach the same size, so a lookup searches at most log2(chunks) arrays.
+    `save` writes them as one new segment, merged the same way with the last
+    segments when they are not much larger, and commits it in `manifest.json`
+    together with the state of the output they belong to. Every key is rewritten
+    O(log(runs)) times, not on every run. Without a `path`, the set only lives
+    in memory.
+    '''
+
+    def __init__(self, path=None):
+        self.path = path
+        self.manifest = {'segments': [], 'output_size': None}
+        if path:
+            os.makedirs(path, exist_ok=True)
+            if os.path.exists(self.file('manifest.json')):
+                with open(self.file('manifest.json')) as f:
+                    self.manifest = json.load(f)
+            self.clean()
+        self.segments = [np.load(self.file(name), mmap_mode='r')
+                         for name in self.manifest['segments']]
+        self.runs = []
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def clean(self):
+        '''Remove the segments that are not committed in the manifest.'''
+        for name in os.listdir(self.path):
+            if name.endswith('.npy') and name not in self.manifest['segments']:
+                os.remove(self.file(name))
+
+    def __len__(self):
+        return sum(len(keys) for keys in self.segments + self.runs)
+
+    def contains(self, hashes):
+        found = np.zeros(len(hashes), dtype=bool)
+        for keys in self.segments + self.runs:
+            if len(keys):
+                pos = np.searchsorted(keys, hashes).clip(max=len(keys) - 1)
+                found |= keys[pos] == hashes
+        return found
+
+    def add(self, hashes):
+        run = np.unique(hashes)
+        while self.runs and len(self.runs[-1]) <= 2 * len(run):
+            run = np.union1d(self.runs.pop(), run)
+        if len(run):
+            self.runs.append(run)
+
+    def save(self, **state):
+        '''Write the new keys as one segment, then commit them with `state`.'''
+        if self.path is None:
+            return
+        if self.runs:
+            self.write(np.unique(np.concatenate(self.runs)))
+            self.runs = []
+        manifest = {**self.manifest, **state}
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f)
+        publish(tmp)
+        os.replace(tmp, self.file('manifest.json'))
+        self.manifest = manifest
+        self.clean()
+
+    def write(self, keys):
+        '''Write `keys` as a new segment, merged with the last segments of a similar size.'''
+        segments = self.manifest['segments']
+        while self.segments and len(self.segments[-1]) <= 2 * len(keys):
+            keys = np.union1d(np.asarray(self.segments.pop()), keys)
+            segments = segments[:-1]
+        name = f'{uuid.uuid4().hex}.npy'
+        np.save(self.file(name), keys)
+        self.manifest = {**self.manifest, 'segments': segments + [name]}
+        self.segments.append(keys)
+
+
+'''
+   -------------------------------------------------------------------------------------------
+                                        CHUNK VALIDATION
+   -------------------------------------------------------------------------------------------
+'''
+
+
+def hash_keys(chunk, keys):
+    return pd.util.hash_pandas_object(chunk[keys].astype(str), index=False).to_numpy()
+
+
+def check_chunk(chunk, seen, schema=RAW_SCHEMA):
+    '''Flag every row of a chunk read as str, returns a DataFrame with one boolean column per check.
+
+    A row is only flagged by its first failing check, in the order of CHECKS, so the
+    report counts add up to the number of dropped rows.
+    '''
+    flags = pd.DataFrame(False, index=chunk.index, columns=CHECKS)
+    flags['blank'] = chunk.isna().all(axis=1)
+    flags['header'] = (chunk == chunk.columns.to_numpy()).all(axis=1)
+    rejected = flags['blank'] | flags['header']
+
+    quantity = pd.to_numeric(chunk[schema['quantity']], errors='coerce')
+    price = pd.to_numeric(chunk[schema['price']], errors='coerce')
+    date = pd.to_datetime(chunk[schema['date']], format=DATE_FORMAT, errors='coerce')
+
+    flags['bad_quantity'] = ~rejected & ~((quantity > 0) & (quantity % 1 == 0))
+    rejected |= flags['bad_quantity']
+    flags['bad_price'] = ~rejected & ~(price > 0)
+    rejected |= flags['bad_price']
+    flags['bad_date'] = ~rejected & date.isna()
+    rejected |= flags['bad_date']
+
+    # duplicates, within the chunk and against every previously ingested file
+    valid = ~rejected.to_numpy()
+    hashes = hash_keys(chunk[valid], schema['keys'])
+    duplicate = pd.Series(hashes).duplicated().to_numpy() | seen.contains(hashes)
+    flags.loc[valid, 'duplicate'] = duplicate
+    seen.add(hashes[~duplicate])
+    return flags
+
+
+def read_chunks(path, chunksize=CHUNKSIZE):
+    # blank lines are kept, to be counted by the report
+    return pd.read_csv(path, dtype=str, chunksize=chunksize, skip_blank_lines=False)
+
+
+def check_file(path, output, seen, chunksize=CHUNKSIZE, schema=RAW_SCHEMA):
+    '''Append the valid rows of `path` to `output`, returns the counts of every check.'''
+    counts = pd.Series(0, index=['rows'] + CHECKS + ['kept'], name=path)
+    for chunk in read_chunks(path, chunksize):
+        flags = check_chunk(chunk, seen, schema)
+        kept = chunk[~flags.any(axis=1)]
+        kept.to_csv(output, mode='a', index=False,
+                    header=not os.path.exists(output) or os.path.getsize(output) == 0)
+        counts['rows'] += len(chunk)
+        counts[CHECKS] += flags.sum()
+        counts['kept'] += len(kept)
+    return counts
+
+
+'''
+   -------------------------------------------------------------------------------------------
+                                            INGESTION
+   -------------------------------------------------------------------------------------------
+'''
+
+
+def ingest(paths, output=VALIDATED_DATA, seen=SEEN_KEYS, chunksize=CHUNKSIZE, schema=RAW_SCHEMA):
+    '''Stream new raw order exports into `output`, dropping malformed and duplicated lines.
+
+    Only the new files are read: the keys of previous runs are kept in `seen`.
+    The size of `output` is committed with the keys, so the rows appended by an
+    interrupted run are truncated on the next one instead of being duplicated.
+    Returns the quality report, one row per file.
+    '''
+    seen = KeyStore(seen)
+    # without a manifest nothing was committed yet, not even by an interrupted first run
+    committed = seen.manifest['output_size'] or 0
+    if os.path.exists(output) and os.path.getsize(output) > committed:
+        with open(output, 'r+b') as f:
+            f.truncate(committed)
+    report = [check_file(path, output, seen, chunksize, schema) for path in paths]
+    seen.save(output_size=os.path.getsize(output) if os.path.exists(output) else 0)
+    return pd.DataFrame(report)
+
+
+def validate(path, output, chunksize=CHUNKSIZE, schema=CLEAN_SCHEMA):
+    '''Validate a whole file into `output`, replaced in one step once fully written.'''
+    directory = os.path.dirname(output) or '.'
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.csv')
+    os.close(fd)
+    counts = check_file(path, tmp, KeyStore(), chunksize, schema)
+    publish(tmp)
+    os.replace(tmp, output)
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Validate and deduplicate raw order exports.')
+    parser.add_argument('paths', nargs='+', help='raw csv exports')
+    parser.add_argument('--output', default=VALIDATED_DATA)
+    parser.add_argument('--seen', default=SEEN_KEYS)
+    parser.add_argument('--report', default=QUALITY_REPORT)
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE)
+    args = parser.parse_args()
+
+    report = ingest(args.paths, args.output, args.seen, args.chunksize)
+    report.to_csv(args.report, mode='a', index_label='file',
+                  header=not os.path.exists(args.report))
+    print(report.to_string())
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+
+'''
+   -------------------------------------------------------------------------------------------
+   CONFIG
+   -------------------------------------------------------------------------------------------
+'''
+# above this number of rows, the rows between the top and bottom ones are folded in one bar
+MAX_BARS = 25
+GROUPS = ['bottom', 'middle', 'others', 'top']
+
+
+def largest(values, k):
+    '''Positions of the k largest values, in descending order, without a full sort.'''
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+    n = len(values)
+    positions = np.argpartition(values, n - k)[n - k:]
+    return positions[np.argsort(values[positions], kind='stable')[::-1]]
+
+
+def smallest(values, k):
+    '''Positions of the k smallest values, in ascending order, without a full sort.'''
+    if k <= 0:
+        return np.array([], dtype=np.int64)
+    positions = np.argpartition(values, k - 1)[:k]
+    return positions[np.argsort(values[positions], kind='stable')]
+
+
+def rank(report, column, k_top, k_bottom=0, max_bars=MAX_BARS, others='autres'):
+    '''Bars of a ranking of the rows of `report` by `column`, from the lowest to the highest.
+
+    The bars keep the columns of `report` plus a `group` column (see GROUPS). The
+    rows that are neither in the top nor in the bottom are drawn one by one when
+    there is room for them, otherwise they are summed in a single "others" bar.
+    '''
+    values = report[column].to_numpy()
+    n = len(values)
+    k_top = min(k_top, n)
+    k_bottom = min(k_bottom, n - k_top)
+
+    top = largest(values, k_top)
+    outside = np.ones(n, dtype=bool)
+    outside[top] = False
+    rest = np.flatnonzero(outside)
+    bottom = rest[smallest(values[rest], k_bottom)]
+    outside[bottom] = False
+    middle = np.flatnonzero(outside)
+
+    bars = [report.iloc[bottom].assign(group='bottom')]
+    if n <= max_bars:
+        middle = middle[np.argsort(values[middle], kind='stable')]
+        bars.append(report.iloc[middle].assign(group='middle'))
+    elif len(middle):
+        bars.append(pd.DataFrame(
+            {column: [values[middle].sum()], 'group': ['others']},
+            index=pd.Index([f'{len(middle)} {others}'], name=report.index.name)))
+    bars.append(report.iloc[top[::-1]].assign(group='top'))
+    return pd.concat(bars)
+
+
+def shares(bars, column):
+    '''Part of the total of `column` held by every group of bars.'''
+    return bars.groupby('group')[column].sum().reindex(GROUPS, fill_value=0) / bars[column].sum()
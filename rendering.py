@@ -0,0 +1,24 @@
+import plotly.graph_objects as go
+
+
+'''
+   -------------------------------------------------------------------------------------------
+   CONFIG
+   -------------------------------------------------------------------------------------------
+'''
+# above this number of points, scatter plots are drawn with WebGL instead of SVG
+WEBGL_THRESHOLD = 1000
+
+
+'''
+   -------------------------------------------------------------------------------------------
+                                            TRACES
+   -------------------------------------------------------------------------------------------
+'''
+
+
+def scatter(**kwargs):
+    '''go.Scatter, or go.Scattergl when the trace has more than WEBGL_THRESHOLD points.'''
+    if len(kwargs.get('x', ())) > WEBGL_THRESHOLD:
+        return go.Scattergl(**kwargs)
+    return go.Scatter(**kwargs)
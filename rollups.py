@@ -0,0 +1,97 @@
+from collections import OrderedDict
+import ranking
+import temporal
+
+
+'''
+   -------------------------------------------------------------------------------------------
+   CONFIG
+   -------------------------------------------------------------------------------------------
+'''
+# summed columns of the product report, the other numeric columns are not measures
+MEASURES = ['Quantity Ordered', 'Sales']
+# number of (aggregate, city, category) results kept, the least recently used go first
+CACHE_SIZE = 256
+
+
+class Rollups:
+    '''Aggregates of the clean data behind the figures, computed once per filter.
+
+    Every aggregate can be restricted to a city and/or a category, the results are
+    cached by (aggregate, city, category) in a bounded LRU cache.
+    '''
+
+    def __init__(self, data, cache_size=CACHE_SIZE):
+        self.data = data
+        self.cities = set(data['City'])
+        self.categories = set(data['Cat'])
+        # dates are parsed once, kept aside so the summed aggregates never see them
+        self.hours = temporal.hour_of_week(data['Order Date'])
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+
+    def subset(self, city=None, cat=None):
+        df = self.data
+        if city:
+            df = df[df['City'] == city]
+        if cat:
+            df = df[df['Cat'] == cat]
+        return df
+
+    def known(self, city=None, cat=None):
+        '''True when the city and category filters are empty or present in the data.'''
+        return (not city or city in self.cities) and (not cat or cat in self.categories)
+
+    def cached(self, name, compute, city=None, cat=None):
+        key = (name, city, cat)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+        else:
+            self.cache[key] = compute(city, cat)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return self.cache[key]
+
+    def product_report(self, city=None, cat=None):
+        return self.cached(
+            'product_report',
+            lambda city, cat: self.subset(city, cat).groupby(['Cat', 'Product', 'Price Each'])[MEASURES].sum(),
+            city, cat)
+
+    def city_sales(self, city=None, cat=None):
+        def compute(city, cat):
+            city_sales = self.subset(city, cat).groupby(['City', 'lat', 'long'])['Sales'].sum().reset_index()
+            city_sales['percents'] = city_sales['Sales']/city_sales['Sales'].sum()
+            return city_sales
+        return self.cached('city_sales', compute, city, cat)
+
+    def sales_per_month(self, city=None, cat=None):
+        return self.cached(
+            'sales_per_month',
+            lambda city, cat: self.subset(city, cat).groupby(['Month_num', 'Month'])['Sales'].sum().reset_index(),
+            city, cat)
+
+    def buying_hours(self, city=None, cat=None):
+        return self.cached(
+            'buying_hours',
+            lambda city, cat: self.subset(city, cat).groupby('Hour')['Quantity Ordered'].sum(),
+            city, cat)
+
+    def hour_of_week(self, city=None, cat=None):
+        def compute(city, cat):
+            df = self.subset(city, cat)
+            return temporal.city_hour_of_week(df, self.hours[df.index])
+        return self.cached('hour_of_week', compute, city, cat)
+
+    def product_ranking(self, k_top, k_bottom, city=None, cat=None):
+        def compute(city, cat):
+            df = self.product_report(city, cat).reset_index(['Cat', 'Price Each'])
+            df['percent'] = df['Sales']/df['Sales'].sum() * 100
+            return ranking.rank(df, 'percent', k_top, k_bottom, others='autres produits')
+        return self.cached(('product_ranking', k_top, k_bottom), compute, city, cat)
+
+    def city_ranking(self, k_top, city=None, cat=None):
+        def compute(city, cat):
+            df = self.city_sales(city, cat).set_index('City')
+            return ranking.rank(df, 'percents', k_top, others='autres villes')
+        return self.cached(('city_ranking', k_top), compute, city, cat)
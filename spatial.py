@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+
+'''
+   -------------------------------------------------------------------------------------------
+   CONFIG
+   -------------------------------------------------------------------------------------------
+'''
+MAX_ZOOM = 14
+# a 256px map tile is split in 2**CELL_BITS cells per side
+CELL_BITS = 5
+# viewports holding at most this number of locations show them without aggregation
+MAX_POINTS = 500
+
+
+def cell_size(zoom):
+    '''Side of a grid cell at `zoom`, in degrees.'''
+    return 360 / 2 ** (zoom + CELL_BITS)
+
+
+'''
+   -------------------------------------------------------------------------------------------
+                                            POINTS
+   -------------------------------------------------------------------------------------------
+'''
+
+
+def order_points(data, zip_info=None):
+    '''Sales per location: one row per (lat, long, label).
+
+    Orders are located at their zip code when a `zip_info` table (zip, lat, long)
+    is given, otherwise at the coordinates of their city.
+    '''
+    df = data[['City', 'lat', 'long', 'Sales']].rename(columns={'City': 'label'})
+    if zip_info is not None:
+        zips = data['Purchase Address'].str[-5:]
+        coords = zip_info.set_index('zip')[['lat', 'long']]
+        located = zips.isin(coords.index)
+        df.loc[located, ['lat', 'long']] = coords.loc[zips[located]].to_numpy()
+    df = df.assign(orders=1)
+    return df.groupby(['lat', 'long', 'label'], sort=False).sum().reset_index()
+
+
+'''
+   -------------------------------------------------------------------------------------------
+                                            PYRAMID
+   -------------------------------------------------------------------------------------------
+'''
+
+
+def aggregate(points, zoom):
+    '''Group `points` into the grid cells of `zoom`.
+
+    Each cell is placed at the centroid of its points and labelled after its
+    best selling point.
+    '''
+    size = cell_size(zoom)
+    ix = np.floor((points['long'].to_numpy() + 180) / size).astype(np.int64)
+    iy = np.floor((points['lat'].to_numpy() + 90) / size).astype(np.int64)
+    codes, keys = pd.factorize(ix * 2 ** (zoom + CELL_BITS) + iy)
+
+    n = len(keys)
+    count = np.bincount(codes, minlength=n)
+    sales = points['Sales'].to_numpy()
+    # rows sorted by cell then sales: the best point of a cell is the last row of its run
+    order = np.lexsort((sales, codes))
+    best = order[np.flatnonzero(np.diff(codes[order], append=n))]
+    cells = pd.DataFrame({
+        'cell': keys,
+        'lat': np.bincount(codes, weights=points['lat'].to_numpy(), minlength=n) / count,
+        'long': np.bincount(codes, weights=points['long'].to_numpy(), minlength=n) / count,
+        'Sales': np.bincount(codes, weights=sales, minlength=n),
+        'orders': np.bincount(codes, weights=points['orders'].to_numpy(), minlength=n),
+        'label': points['label'].to_numpy()[best],
+    })
+    return cells.sort_values('long', ignore_index=True)
+
+
+class SalesPyramid:
+    '''Sales aggregated on a grid for every zoom level, queried by viewport.'''
+
+    def __init__(self, points, max_zoom=MAX_ZOOM, max_points=MAX_POINTS):
+        self.max_zoom = max_zoom
+        self.max_points = max_points
+        self.points = points.sort_values('long', ignore_index=True)
+        self.levels = [aggregate(points, zoom) for zoom in range(max_zoom + 1)]
+
+    def level(self, zoom):
+        return int(np.clip(np.floor(zoom), 0, self.max_zoom))
+
+    def query(self, zoom, bounds=None):
+        '''Cells of the `zoom` level inside `bounds` = (west, south, east, north).
+
+        When the viewport holds few enough locations, they are returned as they are.
+        '''
+        points = within(self.points, bounds)
+        if len(points) <= self.max_points:
+            return points
+        return within(self.levels[self.level(zoom)], bounds)
+
+
+def within(cells, bounds):
+    '''Rows of `cells`, sorted by longitude, inside `bounds`.'''
+    if bounds is None:
+        return cells
+    west, south, east, north = bounds
+    start, stop = cells['long'].searchsorted([west, east], side='left')
+    cells = cells.iloc[start:stop]
+    return cells[cells['lat'].between(south, north)]
+
+
+def viewport(relayout):
+    '''(west, south, east, north) of a mapbox `relayoutData`, None if unknown.'''
+    coordinates = (relayout or {}).get('mapbox._derived', {}).get('coordinates')
+    if not coordinates:
+        return None
+    lon, lat = np.array(coordinates).T
+    return lon.min(), lat.min(), lon.max(), lat.max()
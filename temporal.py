@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+from quality import DATE_FORMAT
+
+
+'''
+   -------------------------------------------------------------------------------------------
+   CONFIG
+   -------------------------------------------------------------------------------------------
+'''
+WEEKDAYS = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
+HOURS_PER_WEEK = 7 * 24
+
+
+def hour_of_week(dates):
+    '''Hour of the week of every order date, from 0 (monday 0h) to 167 (sunday 23h).'''
+    dates = pd.to_datetime(dates, format=DATE_FORMAT)
+    return (dates.dt.dayofweek * 24 + dates.dt.hour).astype(np.int16)
+
+
+def city_hour_of_week(df, hours=None):
+    '''Orders and sales per (city, hour of the week), one row per pair.
+
+    Cities and hours are encoded as a single integer key, so both sums are one
+    bincount over the orders instead of a multi-key groupby. `hours` holds the
+    hour of the week of the orders of `df`, parsed from their dates when missing.
+    '''
+    if hours is None:
+        hours = hour_of_week(df['Order Date'])
+    codes, cities = pd.factorize(df['City'], sort=True)
+    keys = codes.astype(np.int64) * HOURS_PER_WEEK + np.asarray(hours)
+    n = len(cities) * HOURS_PER_WEEK
+    hours = np.tile(np.arange(HOURS_PER_WEEK), len(cities))
+    return pd.DataFrame({
+        'City': np.repeat(cities.to_numpy(), HOURS_PER_WEEK),
+        'weekday': hours // 24,
+        'hour': hours % 24,
+        'orders': np.bincount(keys, minlength=n),
+        'Sales': np.bincount(keys, weights=df['Sales'].to_numpy(), minlength=n),
+    })
+
+
+def week_matrix(df, column):
+    '''7 x 24 (weekday, hour) matrix of `column`, summed over the cities of `df`.'''
+    keys = (df['weekday'] * 24 + df['hour']).to_numpy()
+    matrix = np.bincount(keys, weights=df[column].to_numpy(), minlength=HOURS_PER_WEEK)
+    return matrix.reshape(7, 24)
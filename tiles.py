@@ -0,0 +1,95 @@
+import os
+import math
+import argparse
+import urllib.request
+import pandas as pd
+import spatial
+
+
+'''
+   -------------------------------------------------------------------------------------------
+   CONFIG
+   -------------------------------------------------------------------------------------------
+'''
+TILE_DIR = 'data/tiles'
+TILE_SOURCE = 'https://a.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png'
+# (west, south, east, north) of the delivery area, seeded whole up to AREA_ZOOM
+BOUNDS = (-125, 24, -66, 50)
+AREA_ZOOM = 7
+# beyond, only the tiles around the order locations, up to the last level of the map
+MAX_ZOOM = spatial.MAX_ZOOM
+RADIUS = 1
+# csv files with lat and long columns, the order locations
+LOCATIONS = ['data/clean_data.csv', 'data/zip_info.csv']
+USER_AGENT = 'sale_analysis tile seeder'
+
+
+def tile_xy(lon, lat, zoom):
+    '''Web mercator tile holding (lon, lat) at `zoom`.'''
+    n = 2 ** zoom
+    x = int((lon + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(x, n - 1), min(y, n - 1)
+
+
+def tiles(bounds=BOUNDS, max_zoom=AREA_ZOOM, min_zoom=0):
+    west, south, east, north = bounds
+    for zoom in range(min_zoom, max_zoom + 1):
+        x0, y0 = tile_xy(west, north, zoom)
+        x1, y1 = tile_xy(east, south, zoom)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield zoom, x, y
+
+
+def around(locations, min_zoom=AREA_ZOOM + 1, max_zoom=MAX_ZOOM, radius=RADIUS):
+    '''Tiles within `radius` tiles of the (long, lat) `locations`, from `min_zoom` to `max_zoom`.'''
+    found = set()
+    for lon, lat in locations:
+        for zoom in range(min_zoom, max_zoom + 1):
+            x, y = tile_xy(lon, lat, zoom)
+            n = 2 ** zoom
+            found.update((zoom, i, j)
+                         for i in range(max(x - radius, 0), min(x + radius, n - 1) + 1)
+                         for j in range(max(y - radius, 0), min(y + radius, n - 1) + 1))
+    return sorted(found)
+
+
+def read_locations(paths=LOCATIONS):
+    '''Distinct (long, lat) of the csv files of `paths` that exist.'''
+    frames = [pd.read_csv(path, usecols=['long', 'lat']) for path in paths if os.path.exists(path)]
+    if not frames:
+        return []
+    df = pd.concat(frames).dropna().round(3).drop_duplicates()
+    return list(df[['long', 'lat']].itertuples(index=False, name=None))
+
+
+def seed(tile_dir=TILE_DIR, source=TILE_SOURCE, bounds=BOUNDS, area_zoom=AREA_ZOOM,
+         locations=(), max_zoom=MAX_ZOOM):
+    '''Download the tiles of `bounds` up to `area_zoom`, then the tiles around
+    `locations` up to `max_zoom`, so the map can be served offline.'''
+    for zoom, x, y in [*tiles(bounds, area_zoom), *around(locations, area_zoom + 1, max_zoom)]:
+        path = os.path.join(tile_dir, str(zoom), str(x), f'{y}.png')
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        url = source.format(z=zoom, x=x, y=y)
+        request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+        with urllib.request.urlopen(request) as response:
+            content = response.read()
+        with open(path + '.tmp', 'wb') as f:
+            f.write(content)
+        os.replace(path + '.tmp', path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download the map tiles served by the report.')
+    parser.add_argument('--dir', default=TILE_DIR)
+    parser.add_argument('--source', default=TILE_SOURCE)
+    parser.add_argument('--area-zoom', type=int, default=AREA_ZOOM)
+    parser.add_argument('--max-zoom', type=int, default=MAX_ZOOM)
+    parser.add_argument('--locations', nargs='*', default=LOCATIONS,
+                        help='csv files with the lat and long of the orders')
+    args = parser.parse_args()
+    seed(args.dir, args.source, area_zoom=args.area_zoom,
+         locations=read_locations(args.locations), max_zoom=args.max_zoom)